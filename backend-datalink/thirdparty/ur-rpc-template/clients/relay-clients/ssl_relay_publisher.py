@@ -9,22 +9,46 @@ Usage: python3 ssl_relay_publisher.py
 """
 
 import paho.mqtt.client as mqtt
+import asyncio
 import json
 import time
 import sys
 import ssl
 import argparse
 import os
+import re
 from datetime import datetime
 
+from ssl_session import SessionResumingContext
+
+# Matches SSL-related paho log lines in a single scan
+_SSL_LOG_RE = re.compile(r"SSL|TLS|certificate")
+
+# Bound on unacknowledged QoS > 0 messages paho will hold before publish()
+# returns MQTT_ERR_QUEUE_SIZE; that return code is the publish back-pressure signal
+MAX_QUEUED_MESSAGES = 20
+
+# How long a publish keeps retrying against a full outgoing queue
+QUEUE_FULL_TIMEOUT = 5
+
 class SSLRelayPublisher:
-    def __init__(self, host="localhost", port=1884, verbose=False):
+    def __init__(self, host="localhost", port=1884, verbose=False, aggregate=1, qos=0):
         self.host = host
         self.port = port
         self.verbose = verbose
+        self.aggregate = max(1, aggregate)
+        self.qos = qos
         self.client = None
         self.connected = False
         self.messages_published = 0
+        self.loop = None
+        self.misc_task = None
+        self.reconnect_task = None
+        self.ssl_context = None
+        
+        # Backoff bounds for reconnecting after the broker drops the connection
+        self.reconnect_min_delay = 1
+        self.reconnect_max_delay = 30
         
         # SSL certificate paths (same as ssl_relay_config.json)
         self.ca_cert = "../ssl_certs/ca.crt"
@@ -40,20 +64,27 @@ class SSLRelayPublisher:
         self.client.on_connect = self.on_connect
         self.client.on_publish = self.on_publish
         self.client.on_disconnect = self.on_disconnect
+        self.client.max_queued_messages_set(MAX_QUEUED_MESSAGES)
+        
+        # Drive network I/O from the asyncio event loop instead of a loop_start() thread
+        self.client.on_socket_open = self.on_socket_open
+        self.client.on_socket_close = self.on_socket_close
+        self.client.on_socket_register_write = self.on_socket_register_write
+        self.client.on_socket_unregister_write = self.on_socket_unregister_write
         
         if self.verbose:
             self.client.on_log = self.on_log
             
         # Configure SSL/TLS
         try:
-            self.client.tls_set(
-                ca_certs=self.ca_cert,
-                certfile=self.client_cert,
-                keyfile=self.client_key,
-                cert_reqs=ssl.CERT_REQUIRED,
-                tls_version=ssl.PROTOCOL_TLS,
-                ciphers=None
-            )
+            # Built once and reused so reconnects can resume the TLS session
+            if self.ssl_context is None:
+                self.ssl_context = SessionResumingContext(ssl.PROTOCOL_TLS_CLIENT)
+                self.ssl_context.minimum_version = ssl.TLSVersion.TLSv1_2
+                self.ssl_context.load_verify_locations(cafile=self.ca_cert)
+                self.ssl_context.load_cert_chain(certfile=self.client_cert, keyfile=self.client_key)
+                self.ssl_context.options &= ~ssl.OP_NO_TICKET
+            self.client.tls_set_context(self.ssl_context)
             print(f"🔐 SSL configuration applied with certificates:")
             print(f"   CA: {self.ca_cert}")
             print(f"   Cert: {self.client_cert}")
@@ -67,11 +98,20 @@ class SSLRelayPublisher:
     def check_ssl_certificates(self):
         """Check if SSL certificates exist"""
         ssl_files = [self.ca_cert, self.client_cert, self.client_key]
-        missing_files = []
         
-        for ssl_file in ssl_files:
-            if not os.path.exists(ssl_file):
-                missing_files.append(ssl_file)
+        # One directory scan per certificate directory instead of a stat per file
+        dir_entries = {}
+        for ssl_dir in {os.path.dirname(ssl_file) or "." for ssl_file in ssl_files}:
+            try:
+                with os.scandir(ssl_dir) as entries:
+                    dir_entries[ssl_dir] = {entry.name for entry in entries}
+            except OSError:
+                dir_entries[ssl_dir] = set()
+                
+        missing_files = [
+            ssl_file for ssl_file in ssl_files
+            if os.path.basename(ssl_file) not in dir_entries[os.path.dirname(ssl_file) or "."]
+        ]
                 
         if missing_files:
             print("❌ Missing SSL certificate files:")
@@ -99,29 +139,92 @@ class SSLRelayPublisher:
         self.connected = False
         print(f"🔐 SSL disconnected from source broker")
         
+        # A non-zero rc means the connection was lost rather than closed by disconnect()
+        if rc != 0 and self.loop and (self.reconnect_task is None or self.reconnect_task.done()):
+            self.reconnect_task = self.loop.create_task(self.reconnect_loop())
+        
     def on_log(self, client, userdata, level, buf):
         # Only log SSL-related messages
-        if "SSL" in buf or "TLS" in buf or "certificate" in buf:
+        if _SSL_LOG_RE.search(buf):
             print(f"🔐 SSL Log: {buf}")
         
-    def connect(self):
+    def on_socket_open(self, client, userdata, sock):
+        self.loop.add_reader(sock, client.loop_read)
+        self.misc_task = self.loop.create_task(self.misc_loop())
+        
+    def on_socket_close(self, client, userdata, sock):
+        self.loop.remove_reader(sock)
+        if self.misc_task:
+            self.misc_task.cancel()
+            self.misc_task = None
+            
+    def on_socket_register_write(self, client, userdata, sock):
+        self.loop.add_writer(sock, client.loop_write)
+        
+    def on_socket_unregister_write(self, client, userdata, sock):
+        self.loop.remove_writer(sock)
+        
+    async def misc_loop(self):
+        """Run paho's keepalive and retry housekeeping once per second"""
+        while self.client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+            await asyncio.sleep(1)
+            
+    async def reconnect_loop(self):
+        """Reconnect to the source broker with exponential backoff"""
+        delay = self.reconnect_min_delay
+        while True:
+            print(f"🔄 Reconnecting to SSL source broker in {delay}s...")
+            await asyncio.sleep(delay)
+            try:
+                # on_socket_open re-registers the new socket; on_connect fires on CONNACK
+                if self.client.reconnect() == mqtt.MQTT_ERR_SUCCESS:
+                    return
+            except OSError as e:
+                print(f"❌ SSL reconnect failed: {e}")
+            delay = min(delay * 2, self.reconnect_max_delay)
+            
+    async def connect(self):
         """Connect to the SSL source broker"""
         try:
+            self.loop = asyncio.get_running_loop()
             self.client.connect(self.host, self.port, 60)
-            self.client.loop_start()
             
             # Wait for SSL connection
             timeout = 15  # SSL connections may take longer
             while not self.connected and timeout > 0:
-                time.sleep(0.5)
-                timeout -= 0.5
+                await asyncio.sleep(0.05)
+                timeout -= 0.05
                 
             return self.connected
         except Exception as e:
             print(f"❌ SSL connection failed: {e}")
             return False
             
-    def publish_ssl_test_messages(self):
+    def aggregate_messages(self, test_messages):
+        """Group test messages by topic prefix into NDJSON payloads of up to self.aggregate records"""
+        groups = {}
+        for msg in test_messages:
+            prefix = msg['topic'].rsplit('/', 1)[0]
+            groups.setdefault(prefix, []).append(msg)
+            
+        batches = []
+        for prefix, msgs in groups.items():
+            dest_prefix = msgs[0]['expected_destination'].rsplit('/', 1)[0]
+            for start in range(0, len(msgs), self.aggregate):
+                chunk = msgs[start:start + self.aggregate]
+                if len(chunk) == 1:
+                    batches.append(chunk[0])
+                    continue
+                batches.append({
+                    'topic': f"{prefix}/batch",
+                    'payload': "\n".join(m['payload'] for m in chunk),
+                    'expected_destination': f"{dest_prefix}/batch",
+                    'records': len(chunk)
+                })
+                
+        return batches
+        
+    async def publish_ssl_test_messages(self):
         """Publish encrypted test messages according to ssl_relay_config.json rules"""
         if not self.connected:
             print("❌ Not connected to SSL broker")
@@ -251,29 +354,66 @@ class SSLRelayPublisher:
             }
         ]
         
-        print(f"Publishing {len(test_messages)} encrypted test messages...")
+        record_count = len(test_messages)
+        if self.aggregate > 1:
+            test_messages = self.aggregate_messages(test_messages)
+            print(f"Publishing {record_count} encrypted test records in {len(test_messages)} NDJSON payloads...")
+        else:
+            print(f"Publishing {record_count} encrypted test messages...")
         print()
         
+        # Bind hot-loop lookups to locals once
+        publish = self.client.publish
+        err_success = mqtt.MQTT_ERR_SUCCESS
+        err_queue_size = mqtt.MQTT_ERR_QUEUE_SIZE
+        sleep = asyncio.sleep
+        qos = self.qos
+        total = len(test_messages)
+        pending = []
+        
         for i, msg in enumerate(test_messages, 1):
-            print(f"[{i}/{len(test_messages)}] Publishing to: {msg['topic']}")
+            print(f"[{i}/{total}] Publishing to: {msg['topic']}")
             print(f"                Expected at: {msg['expected_destination']}")
+            if 'records' in msg:
+                print(f"                Records: {msg['records']}")
             
             if self.verbose:
                 payload_preview = msg['payload'][:100] + "..." if len(msg['payload']) > 100 else msg['payload']
                 print(f"                Payload: {payload_preview}")
             
-            result = self.client.publish(msg['topic'], msg['payload'], qos=1)
+            result = publish(msg['topic'], msg['payload'], qos=qos)
             
-            if result.rc == mqtt.MQTT_ERR_SUCCESS:
+            # At QoS > 0, back off only while paho reports its outgoing queue is saturated;
+            # QoS 0 messages are never queued, so the post-loop is_published() wait is their only limit
+            if qos and result.rc == err_queue_size:
+                waited = 0
+                while result.rc == err_queue_size and waited < QUEUE_FULL_TIMEOUT:
+                    await sleep(0.005)
+                    waited += 0.005
+                    result = publish(msg['topic'], msg['payload'], qos=qos)
+                if result.rc == err_queue_size:
+                    print(f"                ⚠️  Outgoing queue still full after {QUEUE_FULL_TIMEOUT}s, giving up")
+            
+            if result.rc == err_success:
+                pending.append(result)
                 print(f"                Status: 🔐 Encrypted & Published successfully")
             else:
                 print(f"                Status: ❌ Publish failed (rc: {result.rc})")
                 
             print()
-            time.sleep(2)  # Slower for SSL processing
+            
+        # publish() only queues packets; let the event loop write them (and collect
+        # PUBACKs at QoS > 0) before reporting totals
+        timeout = 10
+        while timeout > 0 and not all(info.is_published() for info in pending):
+            await sleep(0.05)
+            timeout -= 0.05
+        if timeout <= 0:
+            unconfirmed = sum(1 for info in pending if not info.is_published())
+            print(f"⚠️  {unconfirmed} encrypted messages not confirmed by the broker")
             
         print("=" * 60)
-        print(f"🔐 Completed publishing {len(test_messages)} encrypted test messages")
+        print(f"🔐 Completed publishing {record_count} encrypted test records")
         print(f"📊 Total encrypted messages published: {self.messages_published}")
         print()
         print("📋 Next steps:")
@@ -283,23 +423,23 @@ class SSLRelayPublisher:
         
         return True
         
-    def disconnect(self):
+    async def disconnect(self):
         """Disconnect from the SSL broker"""
+        if self.reconnect_task:
+            self.reconnect_task.cancel()
+            self.reconnect_task = None
+            
         if self.client:
-            self.client.loop_stop()
             self.client.disconnect()
             
-def main():
-    parser = argparse.ArgumentParser(description='SSL Relay Publisher Test')
-    parser.add_argument('--host', default='localhost', help='MQTT broker host')
-    parser.add_argument('--port', type=int, default=1884, help='MQTT broker port')
-    parser.add_argument('--verbose', '-v', action='store_true', help='Verbose output')
-    parser.add_argument('--continuous', '-c', action='store_true', help='Publish messages continuously')
-    parser.add_argument('--interval', type=int, default=15, help='Interval between message sets (seconds)')
-    
-    args = parser.parse_args()
-    
-    publisher = SSLRelayPublisher(args.host, args.port, args.verbose)
+            # Let the event loop flush DISCONNECT before it shuts down
+            timeout = 2
+            while self.connected and timeout > 0:
+                await asyncio.sleep(0.05)
+                timeout -= 0.05
+            
+async def run(args):
+    publisher = SSLRelayPublisher(args.host, args.port, args.verbose, args.aggregate, args.qos)
     
     print("🔐 SSL Relay Publisher Test")
     print("=" * 60)
@@ -316,7 +456,7 @@ def main():
         if not publisher.setup_client():
             return 1
             
-        if not publisher.connect():
+        if not await publisher.connect():
             print("❌ Failed to establish SSL connection to broker")
             return 1
             
@@ -327,14 +467,14 @@ def main():
             
             try:
                 while True:
-                    publisher.publish_ssl_test_messages()
+                    await publisher.publish_ssl_test_messages()
                     print(f"⏳ Waiting {args.interval} seconds before next encrypted cycle...")
                     print()
-                    time.sleep(args.interval)
-            except KeyboardInterrupt:
+                    await asyncio.sleep(args.interval)
+            except (KeyboardInterrupt, asyncio.CancelledError):
                 print("\n🛑 Continuous encrypted publishing stopped by user")
         else:
-            publisher.publish_ssl_test_messages()
+            await publisher.publish_ssl_test_messages()
             
         return 0
         
@@ -342,7 +482,26 @@ def main():
         print(f"❌ SSL Error: {e}")
         return 1
     finally:
-        publisher.disconnect()
+        await publisher.disconnect()
+
+def main():
+    parser = argparse.ArgumentParser(description='SSL Relay Publisher Test')
+    parser.add_argument('--host', default='localhost', help='MQTT broker host')
+    parser.add_argument('--port', type=int, default=1884, help='MQTT broker port')
+    parser.add_argument('--verbose', '-v', action='store_true', help='Verbose output')
+    parser.add_argument('--continuous', '-c', action='store_true', help='Publish messages continuously')
+    parser.add_argument('--interval', type=int, default=15, help='Interval between message sets (seconds)')
+    parser.add_argument('--aggregate', '--batch-payload', type=int, default=1, metavar='N',
+                        help='Pack up to N test records per topic prefix into one NDJSON payload')
+    parser.add_argument('--qos', type=int, choices=[0, 1, 2], default=0,
+                        help='Publish QoS (default 0: no PUBACK round-trip; use 1 for delivery-guarantee tests)')
+    
+    args = parser.parse_args()
+    
+    try:
+        return asyncio.run(run(args))
+    except KeyboardInterrupt:
+        return 0
 
 if __name__ == "__main__":
     sys.exit(main())
\ No newline at end of file
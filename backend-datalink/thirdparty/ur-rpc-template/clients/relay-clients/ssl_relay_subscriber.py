@@ -9,24 +9,39 @@ Usage: python3 ssl_relay_subscriber.py
 """
 
 import paho.mqtt.client as mqtt
+import asyncio
 import json
-import time
 import sys
 import ssl
 import argparse
 import os
+import re
 from datetime import datetime
 
+from ssl_session import SessionResumingContext
+
+# Matches SSL-related paho log lines in a single scan
+_SSL_LOG_RE = re.compile(r"SSL|TLS|certificate")
+
 class SSLRelaySubscriber:
-    def __init__(self, host="localhost", port=1886, verbose=False):
+    def __init__(self, host="localhost", port=1886, verbose=False, qos=0):
         self.host = host
         self.port = port
         self.verbose = verbose
+        self.qos = qos
         self.client = None
         self.connected = False
         self.messages_received = 0
         self.test_results = {}
         self.start_time = None
+        self.loop = None
+        self.misc_task = None
+        self.reconnect_task = None
+        self.ssl_context = None
+        
+        # Backoff bounds for reconnecting after the broker drops the connection
+        self.reconnect_min_delay = 1
+        self.reconnect_max_delay = 30
         
         # SSL certificate paths (same as ssl_relay_config.json)
         self.ca_cert = "../ssl_certs/ca.crt"
@@ -43,19 +58,25 @@ class SSLRelaySubscriber:
         self.client.on_message = self.on_message
         self.client.on_disconnect = self.on_disconnect
         
+        # Drive network I/O from the asyncio event loop instead of a loop_start() thread
+        self.client.on_socket_open = self.on_socket_open
+        self.client.on_socket_close = self.on_socket_close
+        self.client.on_socket_register_write = self.on_socket_register_write
+        self.client.on_socket_unregister_write = self.on_socket_unregister_write
+        
         if self.verbose:
             self.client.on_log = self.on_log
             
         # Configure SSL/TLS
         try:
-            self.client.tls_set(
-                ca_certs=self.ca_cert,
-                certfile=self.client_cert,
-                keyfile=self.client_key,
-                cert_reqs=ssl.CERT_REQUIRED,
-                tls_version=ssl.PROTOCOL_TLS,
-                ciphers=None
-            )
+            # Built once and reused so reconnects can resume the TLS session
+            if self.ssl_context is None:
+                self.ssl_context = SessionResumingContext(ssl.PROTOCOL_TLS_CLIENT)
+                self.ssl_context.minimum_version = ssl.TLSVersion.TLSv1_2
+                self.ssl_context.load_verify_locations(cafile=self.ca_cert)
+                self.ssl_context.load_cert_chain(certfile=self.client_cert, keyfile=self.client_key)
+                self.ssl_context.options &= ~ssl.OP_NO_TICKET
+            self.client.tls_set_context(self.ssl_context)
             print(f"🔐 SSL configuration applied with certificates:")
             print(f"   CA: {self.ca_cert}")
             print(f"   Cert: {self.client_cert}")
@@ -69,11 +90,20 @@ class SSLRelaySubscriber:
     def check_ssl_certificates(self):
         """Check if SSL certificates exist"""
         ssl_files = [self.ca_cert, self.client_cert, self.client_key]
-        missing_files = []
         
-        for ssl_file in ssl_files:
-            if not os.path.exists(ssl_file):
-                missing_files.append(ssl_file)
+        # One directory scan per certificate directory instead of a stat per file
+        dir_entries = {}
+        for ssl_dir in {os.path.dirname(ssl_file) or "." for ssl_file in ssl_files}:
+            try:
+                with os.scandir(ssl_dir) as entries:
+                    dir_entries[ssl_dir] = {entry.name for entry in entries}
+            except OSError:
+                dir_entries[ssl_dir] = set()
+                
+        missing_files = [
+            ssl_file for ssl_file in ssl_files
+            if os.path.basename(ssl_file) not in dir_entries[os.path.dirname(ssl_file) or "."]
+        ]
                 
         if missing_files:
             print("❌ Missing SSL certificate files:")
@@ -99,14 +129,15 @@ class SSLRelaySubscriber:
             
             print("🔔 Subscribing to encrypted destination topics:")
             for topic in subscription_topics:
-                result = client.subscribe(topic, qos=1)
+                result = client.subscribe(topic, qos=self.qos)
                 if result[0] == mqtt.MQTT_ERR_SUCCESS:
                     print(f"   🔐 {topic}")
                 else:
                     print(f"   ❌ {topic} (failed)")
                     
             print()
-            self.start_time = datetime.now()
+            if self.start_time is None:
+                self.start_time = datetime.now()
             print("🎧 Listening for encrypted relayed messages...")
             print("=" * 60)
         else:
@@ -129,33 +160,15 @@ class SSLRelaySubscriber:
                 print(f"   QoS: {msg.qos}")
                 print(f"   Retain: {msg.retain}")
                 
-            # Try to parse JSON payload
-            try:
-                data = json.loads(payload)
-                test_id = data.get('test_id', 'unknown')
-                is_encrypted = data.get('encrypted', False)
-                
-                print(f"   Test ID: {test_id}")
-                print(f"   Encrypted: {'✅ Yes' if is_encrypted else '❌ No'}")
-                
-                # Extract useful fields
-                if 'sensor_id' in data:
-                    print(f"   Sensor: {data['sensor_id']} = {data.get('value', 'N/A')} {data.get('unit', '')}")
-                elif 'event_type' in data:
-                    print(f"   Event: {data['event_type']} - {data.get('message', 'N/A')}")
-                elif 'command' in data:
-                    print(f"   Command: {data['command']} ({data.get('algorithm', 'N/A')})")
-                    
-                # Track test results
-                self.test_results[test_id] = {
-                    'topic': topic,
-                    'timestamp': timestamp,
-                    'data': data,
-                    'encrypted': is_encrypted
-                }
+            # Aggregated publishers send NDJSON: one JSON record per line
+            if "\n" in payload:
+                records = payload.split("\n")
+                print(f"   Records: {len(records)} (NDJSON)")
+            else:
+                records = [payload]
                 
-            except json.JSONDecodeError:
-                print(f"   Encrypted Payload (raw): {payload}")
+            for record in records:
+                self.process_record(topic, record, timestamp)
                 
             # Analyze SSL relay correctness
             self.analyze_ssl_relay_correctness(topic, payload)
@@ -166,6 +179,35 @@ class SSLRelaySubscriber:
         print("   " + "-" * 56)
         print()
         
+    def process_record(self, topic, record, timestamp):
+        """Parse a single JSON test record and track its result"""
+        try:
+            data = json.loads(record)
+            test_id = data.get('test_id', 'unknown')
+            is_encrypted = data.get('encrypted', False)
+            
+            print(f"   Test ID: {test_id}")
+            print(f"   Encrypted: {'✅ Yes' if is_encrypted else '❌ No'}")
+            
+            # Extract useful fields
+            if 'sensor_id' in data:
+                print(f"   Sensor: {data['sensor_id']} = {data.get('value', 'N/A')} {data.get('unit', '')}")
+            elif 'event_type' in data:
+                print(f"   Event: {data['event_type']} - {data.get('message', 'N/A')}")
+            elif 'command' in data:
+                print(f"   Command: {data['command']} ({data.get('algorithm', 'N/A')})")
+                
+            # Track test results
+            self.test_results[test_id] = {
+                'topic': topic,
+                'timestamp': timestamp,
+                'data': data,
+                'encrypted': is_encrypted
+            }
+            
+        except json.JSONDecodeError:
+            print(f"   Encrypted Payload (raw): {record}")
+            
     def analyze_ssl_relay_correctness(self, topic, payload):
         """Analyze if the SSL relay forwarding is working correctly"""
         relay_status = "🔐 CORRECT"
@@ -196,29 +238,68 @@ class SSLRelaySubscriber:
         self.connected = False
         print(f"🔐 SSL disconnected from destination broker")
         
+        # A non-zero rc means the connection was lost rather than closed by disconnect()
+        if rc != 0 and self.loop and (self.reconnect_task is None or self.reconnect_task.done()):
+            self.reconnect_task = self.loop.create_task(self.reconnect_loop())
+        
     def on_log(self, client, userdata, level, buf):
         # Only log SSL-related messages
-        if "SSL" in buf or "TLS" in buf or "certificate" in buf:
+        if _SSL_LOG_RE.search(buf):
             print(f"🔐 SSL Log: {buf}")
         
-    def connect(self):
+    def on_socket_open(self, client, userdata, sock):
+        self.loop.add_reader(sock, client.loop_read)
+        self.misc_task = self.loop.create_task(self.misc_loop())
+        
+    def on_socket_close(self, client, userdata, sock):
+        self.loop.remove_reader(sock)
+        if self.misc_task:
+            self.misc_task.cancel()
+            self.misc_task = None
+            
+    def on_socket_register_write(self, client, userdata, sock):
+        self.loop.add_writer(sock, client.loop_write)
+        
+    def on_socket_unregister_write(self, client, userdata, sock):
+        self.loop.remove_writer(sock)
+        
+    async def misc_loop(self):
+        """Run paho's keepalive and retry housekeeping once per second"""
+        while self.client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+            await asyncio.sleep(1)
+            
+    async def reconnect_loop(self):
+        """Reconnect to the destination broker with exponential backoff"""
+        delay = self.reconnect_min_delay
+        while True:
+            print(f"🔄 Reconnecting to SSL destination broker in {delay}s...")
+            await asyncio.sleep(delay)
+            try:
+                # on_socket_open re-registers the new socket; on_connect fires on CONNACK
+                if self.client.reconnect() == mqtt.MQTT_ERR_SUCCESS:
+                    return
+            except OSError as e:
+                print(f"❌ SSL reconnect failed: {e}")
+            delay = min(delay * 2, self.reconnect_max_delay)
+            
+    async def connect(self):
         """Connect to the SSL destination broker"""
         try:
+            self.loop = asyncio.get_running_loop()
             self.client.connect(self.host, self.port, 60)
-            self.client.loop_start()
             
             # Wait for SSL connection
             timeout = 15  # SSL connections may take longer
             while not self.connected and timeout > 0:
-                time.sleep(0.5)
-                timeout -= 0.5
+                await asyncio.sleep(0.05)
+                timeout -= 0.05
                 
             return self.connected
         except Exception as e:
             print(f"❌ SSL connection failed: {e}")
             return False
             
-    def listen(self, duration=None):
+    async def listen(self, duration=None):
         """Listen for encrypted messages for specified duration"""
         if not self.connected:
             print("❌ Not connected to SSL broker")
@@ -227,13 +308,12 @@ class SSLRelaySubscriber:
         try:
             if duration:
                 print(f"⏱️  Listening for encrypted messages for {duration} seconds...")
-                time.sleep(duration)
+                await asyncio.sleep(duration)
             else:
                 print("🎧 Listening for encrypted messages indefinitely... Press Ctrl+C to stop")
-                while True:
-                    time.sleep(1)
+                await asyncio.Event().wait()
                     
-        except KeyboardInterrupt:
+        except (KeyboardInterrupt, asyncio.CancelledError):
             print("\n🛑 Encrypted listening stopped by user")
             
         return True
@@ -289,22 +369,23 @@ class SSLRelaySubscriber:
                 
             print("=" * 60)
             
-    def disconnect(self):
+    async def disconnect(self):
         """Disconnect from the SSL broker"""
+        if self.reconnect_task:
+            self.reconnect_task.cancel()
+            self.reconnect_task = None
+            
         if self.client:
-            self.client.loop_stop()
             self.client.disconnect()
             
-def main():
-    parser = argparse.ArgumentParser(description='SSL Relay Subscriber Test')
-    parser.add_argument('--host', default='localhost', help='MQTT broker host')
-    parser.add_argument('--port', type=int, default=1886, help='MQTT broker port')
-    parser.add_argument('--verbose', '-v', action='store_true', help='Verbose output')
-    parser.add_argument('--duration', '-d', type=int, help='Listen duration in seconds')
-    
-    args = parser.parse_args()
-    
-    subscriber = SSLRelaySubscriber(args.host, args.port, args.verbose)
+            # Let the event loop flush DISCONNECT before it shuts down
+            timeout = 2
+            while self.connected and timeout > 0:
+                await asyncio.sleep(0.05)
+                timeout -= 0.05
+            
+async def run(args):
+    subscriber = SSLRelaySubscriber(args.host, args.port, args.verbose, args.qos)
     
     print("🔐 SSL Relay Subscriber Test")
     print("=" * 60)
@@ -321,11 +402,11 @@ def main():
         if not subscriber.setup_client():
             return 1
             
-        if not subscriber.connect():
+        if not await subscriber.connect():
             print("❌ Failed to establish SSL connection to broker")
             return 1
             
-        subscriber.listen(args.duration)
+        await subscriber.listen(args.duration)
         
         return 0
         
@@ -334,7 +415,23 @@ def main():
         return 1
     finally:
         subscriber.print_summary()
-        subscriber.disconnect()
+        await subscriber.disconnect()
+
+def main():
+    parser = argparse.ArgumentParser(description='SSL Relay Subscriber Test')
+    parser.add_argument('--host', default='localhost', help='MQTT broker host')
+    parser.add_argument('--port', type=int, default=1886, help='MQTT broker port')
+    parser.add_argument('--verbose', '-v', action='store_true', help='Verbose output')
+    parser.add_argument('--duration', '-d', type=int, help='Listen duration in seconds')
+    parser.add_argument('--qos', type=int, choices=[0, 1, 2], default=0,
+                        help='Subscription QoS (default 0: fastest; use 1 for delivery-guarantee tests)')
+    
+    args = parser.parse_args()
+    
+    try:
+        return asyncio.run(run(args))
+    except KeyboardInterrupt:
+        return 0
 
 if __name__ == "__main__":
     sys.exit(main())
\ No newline at end of file
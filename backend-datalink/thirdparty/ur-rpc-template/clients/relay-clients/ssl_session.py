@@ -0,0 +1,27 @@
+"""
+TLS session resumption helpers shared by the SSL relay test scripts
+
+paho wraps every new connection with the context given to tls_set_context(),
+so keeping the last session on that context lets a reconnect skip the full
+TLS handshake.
+"""
+
+import ssl
+
+class SessionResumingSocket(ssl.SSLSocket):
+    """SSLSocket that hands its TLS session back to its context on close"""
+    
+    def close(self):
+        if self.session is not None:
+            self.context.saved_session = self.session
+        super().close()
+        
+class SessionResumingContext(ssl.SSLContext):
+    """SSLContext that offers the previous TLS session when paho reconnects"""
+    sslsocket_class = SessionResumingSocket
+    saved_session = None
+    
+    def wrap_socket(self, sock, *args, **kwargs):
+        if kwargs.get('session') is None:
+            kwargs['session'] = self.saved_session
+        return super().wrap_socket(sock, *args, **kwargs)
@@ -9,29 +9,201 @@ Tests the basic relay client by:
 """
 
 import paho.mqtt.client as mqtt
+import argparse
+import array
+import collections
 import json
+import select
 import time
 import threading
 import sys
 import subprocess
 import signal
+from concurrent.futures import ThreadPoolExecutor
 import os
+import shutil
+import socket
 from datetime import datetime
 
+# Broker config and log live on tmpfs when available so runs never touch disk
+RUNTIME_DIR = "/dev/shm" if os.access("/dev/shm", os.W_OK) else "."
+DEST_BROKER_CONF = os.path.join(RUNTIME_DIR, "mosquitto_1885.conf")
+DEST_BROKER_LOG = os.path.join(RUNTIME_DIR, "mosquitto_1885.log")
+
+# Local socket the test subscriber uses to reach the destination broker
+DEST_BROKER_SOCKET = "/tmp/mosq_1885.sock"
+
+# Destination broker configuration, pre-encoded for a single write. The relay
+# client reaches it over TCP 1885; the test subscriber uses the UNIX socket
+# listener (requires mosquitto 2.0+).
+DEST_BROKER_CONFIG = f"""
+listener 1885
+listener 0 {DEST_BROKER_SOCKET}
+allow_anonymous true
+connection_messages true
+log_type error
+log_type warning
+log_type notice
+log_type information
+log_dest file {DEST_BROKER_LOG}
+""".encode()
+
+# Line the relay client prints once it is connected and subscribed
+RELAY_READY_LINE = b"Relay functionality started successfully"
+
+# Capacity of the preallocated received-message buffers
+MAX_MSGS = 1024
+
+# First two destination topic levels -> (test result key, pass message)
+RESULT_PREFIXES = {
+    ('forwarded', 'sensors'): ('sensor_forwarding', "✅ Sensor forwarding test PASSED"),
+    ('forwarded', 'system'): ('event_forwarding', "✅ Event forwarding test PASSED"),
+    ('relayed', 'commands'): ('bidirectional_commands', "✅ Bidirectional commands test PASSED")
+}
+
+# Serialized payloads carry this marker in place of the publish timestamp
+TIMESTAMP_PLACEHOLDER = b'"__TS__"'
+
+# (source topic, payload template) pairs published by the test
+TEST_MESSAGES = (
+    # Sensor data (should be forwarded to forwarded/sensors/+)
+    ('data/sensors/temperature', {
+        'sensor_id': 'temp_001',
+        'value': 25.5,
+        'unit': 'celsius',
+        'timestamp': '__TS__'
+    }),
+    ('data/sensors/humidity', {
+        'sensor_id': 'hum_001',
+        'value': 65.0,
+        'unit': 'percent',
+        'timestamp': '__TS__'
+    }),
+    # System events (should be forwarded to forwarded/system/+)
+    ('events/system/startup', {
+        'event_type': 'system_startup',
+        'message': 'System started successfully',
+        'timestamp': '__TS__'
+    }),
+    ('events/system/alert', {
+        'event_type': 'system_alert',
+        'level': 'warning',
+        'message': 'High CPU usage detected',
+        'timestamp': '__TS__'
+    }),
+    # Commands (should be relayed bidirectionally)
+    ('commands/restart', {
+        'command': 'restart_service',
+        'service': 'web_server',
+        'timestamp': '__TS__'
+    })
+)
+
+class SpawnedProcess:
+    """Minimal Popen-style handle for a child started with os.posix_spawnp"""
+    
+    def __init__(self, args, capture_output=False):
+        file_actions = [(os.POSIX_SPAWN_OPEN, 0, os.devnull, os.O_RDONLY, 0)]
+        read_fd = write_fd = None
+        if capture_output:
+            read_fd, write_fd = os.pipe()
+            file_actions += [
+                (os.POSIX_SPAWN_DUP2, write_fd, 1),
+                (os.POSIX_SPAWN_DUP2, write_fd, 2)
+            ]
+        else:
+            file_actions += [
+                (os.POSIX_SPAWN_OPEN, 1, os.devnull, os.O_WRONLY, 0),
+                (os.POSIX_SPAWN_DUP2, 1, 2)
+            ]
+        
+        try:
+            self.pid = os.posix_spawnp(args[0], args, os.environ, file_actions=file_actions)
+        except OSError:
+            if read_fd is not None:
+                os.close(read_fd)
+            raise
+        finally:
+            if write_fd is not None:
+                os.close(write_fd)
+        
+        self.args = args
+        self.stdout = os.fdopen(read_fd, 'rb') if read_fd is not None else None
+        self.returncode = None
+    
+    def poll(self):
+        if self.returncode is None:
+            pid, status = os.waitpid(self.pid, os.WNOHANG)
+            if pid:
+                self.returncode = os.waitstatus_to_exitcode(status)
+        return self.returncode
+    
+    def wait(self):
+        if self.returncode is None:
+            _, status = os.waitpid(self.pid, 0)
+            self.returncode = os.waitstatus_to_exitcode(status)
+        return self.returncode
+    
+    def send_signal(self, sig):
+        if self.returncode is None:
+            os.kill(self.pid, sig)
+    
+    def terminate(self):
+        self.send_signal(signal.SIGTERM)
+    
+    def kill(self):
+        self.send_signal(signal.SIGKILL)
+
+def spawn_process(args, capture_output=False):
+    """Start a child without fork() where posix_spawnp is available"""
+    if hasattr(os, 'posix_spawnp'):
+        return SpawnedProcess(args, capture_output)
+    if capture_output:
+        return subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    return subprocess.Popen(args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+def payload_snippet(payload, limit=100):
+    """Decode the first bytes of a payload for display, straight from a view of the buffer"""
+    return str(memoryview(payload)[:limit], 'utf-8', 'replace')
+
+def wait_for_port(host, port, timeout=2.0):
+    """Poll until a TCP connect to host:port succeeds or the timeout expires"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((host, port), timeout=0.05).close()
+            return True
+        except OSError:
+            time.sleep(0.01)
+    return False
+
 class BasicRelayTester:
-    def __init__(self):
+    def __init__(self, publisher_count=1):
+        self.publisher_count = max(1, publisher_count)
         self.source_host = "localhost"
         self.source_port = 1883
-        self.dest_host = "localhost"
+        self.dest_host = DEST_BROKER_SOCKET
         self.dest_port = 1885
         
         self.source_client = None
+        self.source_clients = []
         self.dest_client = None
         self.relay_process = None
+        self.network_thread = None
+        self.network_stop = threading.Event()
+        
+        # (topic, payload bytes) built from TEST_MESSAGES on first publish
+        self.encoded_messages = None
         
         # Message tracking
         self.sent_messages = []
-        self.received_messages = []
+        
+        # Received messages as parallel preallocated arrays. Only the network
+        # thread writes them, and they are read after it has delivered everything.
+        self.recv_topics = [None] * MAX_MSGS
+        self.recv_payloads = [None] * MAX_MSGS
+        self.recv_ts = array.array('q', [0] * MAX_MSGS)
+        self.recv_idx = 0
         self.test_results = {
             'sensor_forwarding': False,
             'event_forwarding': False,
@@ -39,34 +211,42 @@ class BasicRelayTester:
             'prefix_handling': False
         }
         
-        self.dest_broker_ready = False
         self.test_complete = False
+        
+        # Callback output, buffered so paho's network thread never blocks on stdout
+        self.log = collections.deque()
+        
+        # Readiness signals replacing fixed startup sleeps
+        self.source_ready_evt = threading.Event()
+        self.connected_sources = set()
+        self.dest_ready_evt = threading.Event()
+        self.relay_ready_evt = threading.Event()
+        self.pending_subacks = set()
+        
+        # Set by on_dest_message once every published message has been relayed
+        self.expected_count = None
+        self.all_received = threading.Event()
 
     def setup_destination_broker(self):
         """Start destination broker on port 1885"""
         print("🚀 Starting destination broker on port 1885...")
         
         # Create broker config for port 1885
-        config_content = """
-port 1885
-allow_anonymous true
-connection_messages true
-log_type error
-log_type warning
-log_type notice
-log_type information
-log_dest file mosquitto_1885.log
-"""
-        
-        with open('mosquitto_1885.conf', 'w') as f:
-            f.write(config_content)
+        fd = os.open(DEST_BROKER_CONF, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.write(fd, DEST_BROKER_CONFIG)
+        finally:
+            os.close(fd)
         
         # Start broker
         try:
-            self.dest_broker_process = subprocess.Popen([
-                'mosquitto', '-c', 'mosquitto_1885.conf', '-v'
-            ], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            time.sleep(2)
+            # Broker logging goes to DEST_BROKER_LOG; nothing reads its stdio
+            self.dest_broker_process = spawn_process([
+                'mosquitto', '-c', DEST_BROKER_CONF, '-v'
+            ])
+            if not wait_for_port('localhost', self.dest_port, timeout=2):
+                print("❌ Destination broker did not accept connections within 2s")
+                return False
             print("✅ Destination broker started successfully")
             return True
         except Exception as e:
@@ -77,151 +257,218 @@ log_dest file mosquitto_1885.log
         """Setup MQTT clients for source and destination brokers"""
         print("🔗 Setting up MQTT clients...")
         
-        # Source broker client (publisher)
-        self.source_client = mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION1, client_id="relay_test_publisher")
-        self.source_client.on_connect = self.on_source_connect
-        self.source_client.on_publish = self.on_publish
+        # Source broker clients (publishers); more than one only for stress runs
+        for i in range(self.publisher_count):
+            client_id = "relay_test_publisher" if i == 0 else f"relay_test_publisher_{i}"
+            client = mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION2, client_id=client_id)
+            client.on_connect = self.on_source_connect
+            client.on_publish = self.on_publish
+            client.on_socket_open = self.on_socket_open
+            self.source_clients.append(client)
+        self.source_client = self.source_clients[0]
         
         # Destination broker client (subscriber)
-        self.dest_client = mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION1, client_id="relay_test_subscriber")
+        self.dest_client = mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION2, client_id="relay_test_subscriber", transport="unix")
         self.dest_client.on_connect = self.on_dest_connect
         self.dest_client.on_message = self.on_dest_message
+        self.dest_client.on_subscribe = self.on_dest_subscribe
+        self.dest_client.on_socket_open = self.on_socket_open
+        self.dest_client.max_queued_messages_set(0)
         
         try:
-            self.source_client.connect(self.source_host, self.source_port, 60)
-            self.dest_client.connect(self.dest_host, self.dest_port, 60)
+            for client in self.source_clients:
+                client.connect_async(self.source_host, self.source_port, 60)
+            self.dest_client.connect_async(self.dest_host, self.dest_port, 60)
             
-            self.source_client.loop_start()
-            self.dest_client.loop_start()
+            self.network_thread = threading.Thread(target=self.run_network_loop, daemon=True)
+            self.network_thread.start()
             
-            time.sleep(2)
+            if not (self.source_ready_evt.wait(timeout=2) and self.dest_ready_evt.wait(timeout=2)):
+                print("❌ Failed to connect MQTT clients: no acknowledgement from broker")
+                return False
             print("✅ MQTT clients connected successfully")
             return True
         except Exception as e:
             print(f"❌ Failed to connect MQTT clients: {e}")
             return False
 
-    def on_source_connect(self, client, userdata, flags, rc):
-        print(f"📡 Connected to source broker (port {self.source_port})")
+    def run_network_loop(self):
+        """Drive both MQTT clients from a single select() loop"""
+        clients = (*self.source_clients, self.dest_client)
+        for client in clients:
+            try:
+                client.reconnect()
+            except OSError as e:
+                print(f"❌ Failed to connect MQTT client: {e}")
+        
+        while not self.network_stop.is_set():
+            socks = {}
+            for client in clients:
+                sock = client.socket()
+                if sock:
+                    socks[sock] = client
+            if not socks:
+                time.sleep(0.05)
+                continue
+            
+            wlist = [sock for sock, client in socks.items() if client.want_write()]
+            try:
+                readable, writable, _ = select.select(list(socks), wlist, [], 0.05)
+            except (OSError, ValueError):
+                # A socket was closed from another thread; rebuild the set
+                continue
+            for sock in readable:
+                socks[sock].loop_read()
+            for sock in writable:
+                socks[sock].loop_write()
+            for client in clients:
+                client.loop_misc()
+
+    def on_socket_open(self, client, userdata, sock):
+        # Small test packets should not wait on Nagle's algorithm
+        if sock.family in (socket.AF_INET, socket.AF_INET6):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
 
-    def on_dest_connect(self, client, userdata, flags, rc):
-        print(f"📡 Connected to destination broker (port {self.dest_port})")
-        # Subscribe to expected destination topics
-        client.subscribe("forwarded/sensors/+")
-        client.subscribe("forwarded/system/+")
-        client.subscribe("relayed/commands/+")
-        print("🔔 Subscribed to destination topics")
-        self.dest_broker_ready = True
+    def on_source_connect(self, client, userdata, flags, reason_code, properties):
+        self.log.append(f"📡 Connected to source broker (port {self.source_port})")
+        self.connected_sources.add(client)
+        if len(self.connected_sources) >= self.publisher_count:
+            self.source_ready_evt.set()
 
-    def on_publish(self, client, userdata, mid):
-        print(f"📤 Message published (mid: {mid})")
+    def on_dest_connect(self, client, userdata, flags, reason_code, properties):
+        self.log.append(f"📡 Connected to destination broker ({self.dest_host})")
+        # Subscribe to expected destination topics in one SUBSCRIBE packet (one SUBACK)
+        result, mid = client.subscribe([
+            ("forwarded/sensors/+", 0),
+            ("forwarded/system/+", 0),
+            ("relayed/commands/+", 0)
+        ])
+        self.pending_subacks.add(mid)
+        self.log.append("🔔 Subscribed to destination topics")
+
+    def on_dest_subscribe(self, client, userdata, mid, reason_code_list, properties):
+        # Destination is ready once every subscription has been acknowledged
+        self.pending_subacks.discard(mid)
+        if not self.pending_subacks:
+            self.dest_ready_evt.set()
+
+    def on_publish(self, client, userdata, mid, reason_code, properties):
+        self.log.append(f"📤 Message published (mid: {mid})")
 
     def on_dest_message(self, client, userdata, msg):
         """Handle messages received on destination broker"""
         topic = msg.topic
-        payload = msg.payload.decode()
-        timestamp = datetime.now().isoformat()
+        payload = msg.payload
+        timestamp = time.time_ns()
         
-        print(f"📥 RELAY SUCCESS: Received on destination - Topic: {topic}")
-        print(f"    Payload: {payload}")
+        idx = self.recv_idx
+        if idx < MAX_MSGS:
+            self.recv_topics[idx] = topic
+            self.recv_payloads[idx] = payload
+            self.recv_ts[idx] = timestamp
+        self.recv_idx = idx + 1
         
-        self.received_messages.append({
-            'topic': topic,
-            'payload': payload,
-            'timestamp': timestamp
-        })
+        # Only the slot index is logged here; flush_log formats it from the recv_* arrays
+        self.log.append((topic, idx))
+        
+        if self.expected_count is not None and idx + 1 >= self.expected_count:
+            self.all_received.set()
         
         # Check which test case this message satisfies
-        if topic.startswith("forwarded/sensors/"):
-            self.test_results['sensor_forwarding'] = True
-            print("✅ Sensor forwarding test PASSED")
-            
-        elif topic.startswith("forwarded/system/"):
-            self.test_results['event_forwarding'] = True
-            print("✅ Event forwarding test PASSED")
-            
-        elif topic.startswith("relayed/commands/"):
-            self.test_results['bidirectional_commands'] = True
-            print("✅ Bidirectional commands test PASSED")
+        parts = topic.split('/', 2)
+        result = RESULT_PREFIXES.get((parts[0], parts[1])) if len(parts) > 2 else None
+        if result:
+            self.test_results[result[0]] = True
+            self.log.append(result[1])
+
+    def flush_log(self):
+        """Write buffered callback output to stdout in one call"""
+        lines = []
+        while self.log:
+            entry = self.log.popleft()
+            if isinstance(entry, tuple):
+                topic, idx = entry
+                lines.append(f"📥 RELAY SUCCESS: Received on destination - Topic: {topic}")
+                if idx < MAX_MSGS:
+                    lines.append(f"    Payload: {payload_snippet(self.recv_payloads[idx])}")
+                continue
+            lines.append(entry)
+        if lines:
+            sys.stdout.write("\n".join(lines) + "\n")
+            sys.stdout.flush()
 
     def start_relay_client(self):
         """Start the basic relay client"""
         print("🔄 Starting basic relay client...")
         
+        command = ['./build/basic_relay_client', 'build/basic_relay_config.json']
+        # Line-buffer the relay's stdout so the ready line arrives without delay
+        if shutil.which('stdbuf'):
+            command = ['stdbuf', '-oL'] + command
+        
         try:
-            self.relay_process = subprocess.Popen([
-                './build/basic_relay_client', 'build/basic_relay_config.json'
-            ], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            # stderr is merged so watch_relay_output drains both streams
+            self.relay_process = spawn_process(command, capture_output=True)
             
-            time.sleep(3)
+            threading.Thread(target=self.watch_relay_output, daemon=True).start()
+            
+            if not self.relay_ready_evt.wait(timeout=3):
+                print("⚠️  Relay ready line not seen, continuing")
             print("✅ Basic relay client started")
             return True
         except Exception as e:
             print(f"❌ Failed to start relay client: {e}")
             return False
 
+    def watch_relay_output(self):
+        """Read relay stdout until exit, flagging readiness on the ready line"""
+        for line in iter(self.relay_process.stdout.readline, b''):
+            if RELAY_READY_LINE in line:
+                self.relay_ready_evt.set()
+
     def publish_test_messages(self):
         """Publish test messages to source broker"""
         print("📤 Publishing test messages to source broker...")
         
-        if not self.dest_broker_ready:
+        if not self.dest_ready_evt.is_set():
             print("⏳ Waiting for destination broker to be ready...")
-            time.sleep(3)
+            self.dest_ready_evt.wait(timeout=3)
         
+        if self.encoded_messages is None:
+            self.encoded_messages = [
+                (topic, json.dumps(template, separators=(',', ':')).encode('utf-8'))
+                for topic, template in TEST_MESSAGES
+            ]
+        
+        timestamp = str(time.time()).encode()
         test_messages = [
-            # Sensor data (should be forwarded to forwarded/sensors/+)
-            {
-                'topic': 'data/sensors/temperature',
-                'payload': json.dumps({
-                    'sensor_id': 'temp_001',
-                    'value': 25.5,
-                    'unit': 'celsius',
-                    'timestamp': time.time()
-                })
-            },
-            {
-                'topic': 'data/sensors/humidity',
-                'payload': json.dumps({
-                    'sensor_id': 'hum_001', 
-                    'value': 65.0,
-                    'unit': 'percent',
-                    'timestamp': time.time()
-                })
-            },
-            # System events (should be forwarded to forwarded/system/+)
-            {
-                'topic': 'events/system/startup',
-                'payload': json.dumps({
-                    'event_type': 'system_startup',
-                    'message': 'System started successfully',
-                    'timestamp': time.time()
-                })
-            },
-            {
-                'topic': 'events/system/alert',
-                'payload': json.dumps({
-                    'event_type': 'system_alert',
-                    'level': 'warning',
-                    'message': 'High CPU usage detected',
-                    'timestamp': time.time()
-                })
-            },
-            # Commands (should be relayed bidirectionally)
-            {
-                'topic': 'commands/restart',
-                'payload': json.dumps({
-                    'command': 'restart_service',
-                    'service': 'web_server',
-                    'timestamp': time.time()
-                })
-            }
+            {'topic': topic, 'payload': payload.replace(TIMESTAMP_PLACEHOLDER, timestamp)}
+            for topic, payload in self.encoded_messages
         ]
         
-        for msg in test_messages:
-            print(f"📡 Publishing to {msg['topic']}")
-            self.source_client.publish(msg['topic'], msg['payload'])
-            self.sent_messages.append(msg)
-            time.sleep(1)
+        self.expected_count = len(self.sent_messages) + len(test_messages)
+        
+        # Submit every publish up front, then confirm them together
+        clients = self.source_clients
+        if len(clients) == 1:
+            infos = []
+            for msg in test_messages:
+                print(f"📡 Publishing to {msg['topic']}")
+                infos.append(self.source_client.publish(msg['topic'], msg['payload'], qos=0, retain=False))
+                self.sent_messages.append(msg)
+        else:
+            # paho serializes publishes per client, so spread them across clients
+            with ThreadPoolExecutor(max_workers=len(clients)) as executor:
+                futures = []
+                for i, msg in enumerate(test_messages):
+                    print(f"📡 Publishing to {msg['topic']}")
+                    futures.append(executor.submit(
+                        clients[i % len(clients)].publish, msg['topic'], msg['payload'], qos=0, retain=False))
+                    self.sent_messages.append(msg)
+                infos = [future.result() for future in futures]
+        
+        for info in infos:
+            info.wait_for_publish(timeout=5)
         
         print(f"✅ Published {len(test_messages)} test messages")
 
@@ -245,14 +492,17 @@ log_dest file mosquitto_1885.log
         
         # Wait for relay to initialize
         print("⏳ Waiting for relay initialization...")
-        time.sleep(5)
+        self.relay_ready_evt.wait(timeout=5)
         
         # Publish test messages
         self.publish_test_messages()
         
         # Wait for message processing
         print("⏳ Waiting for message relay processing...")
-        time.sleep(10)
+        if not self.all_received.wait(timeout=10):
+            print("⚠️  Timed out waiting for all relayed messages")
+        
+        self.flush_log()
         
         # Analyze results
         self.analyze_results()
@@ -266,7 +516,7 @@ log_dest file mosquitto_1885.log
         print("=" * 50)
         
         print(f"📊 Messages sent: {len(self.sent_messages)}")
-        print(f"📊 Messages received: {len(self.received_messages)}")
+        print(f"📊 Messages received: {self.recv_idx}")
         
         print("\n🔍 Test Case Results:")
         for test_name, result in self.test_results.items():
@@ -278,38 +528,49 @@ log_dest file mosquitto_1885.log
         overall_status = "✅ ALL TESTS PASSED" if all_passed else "❌ SOME TESTS FAILED"
         print(f"\n🎯 Overall Result: {overall_status}")
         
-        if self.received_messages:
+        if self.recv_idx:
             print("\n📥 Received Messages Details:")
-            for i, msg in enumerate(self.received_messages, 1):
-                print(f"   {i}. Topic: {msg['topic']}")
-                print(f"      Payload: {msg['payload'][:100]}...")
+            for i in range(min(self.recv_idx, MAX_MSGS)):
+                received_at = datetime.fromtimestamp(self.recv_ts[i] / 1e9).isoformat()
+                print(f"   {i + 1}. Topic: {self.recv_topics[i]}")
+                print(f"      Received: {received_at}")
+                print(f"      Payload: {payload_snippet(self.recv_payloads[i])}...")
         
         print("\n" + "=" * 50)
 
     def cleanup(self):
         """Cleanup resources"""
+        self.flush_log()
         print("🧹 Cleaning up...")
         
-        if self.source_client:
-            self.source_client.loop_stop()
-            self.source_client.disconnect()
+        self.network_stop.set()
+        if self.network_thread:
+            self.network_thread.join(timeout=1)
+        
+        for client in self.source_clients:
+            client.disconnect()
         
         if self.dest_client:
-            self.dest_client.loop_stop()
             self.dest_client.disconnect()
         
-        if self.relay_process:
-            self.relay_process.terminate()
-            self.relay_process.wait()
-        
-        if hasattr(self, 'dest_broker_process'):
-            self.dest_broker_process.terminate()
-            self.dest_broker_process.wait()
+        # Signal every child at once, then give them one second before SIGKILL
+        procs = [p for p in (self.relay_process, getattr(self, 'dest_broker_process', None)) if p]
+        for proc in procs:
+            proc.terminate()
+        deadline = time.monotonic() + 1.0
+        while time.monotonic() < deadline and any(proc.poll() is None for proc in procs):
+            time.sleep(0.02)
+        for proc in procs:
+            if proc.poll() is None:
+                proc.kill()
+            proc.wait()
         
         # Clean up config files
-        for file in ['mosquitto_1885.conf', 'mosquitto_1885.log']:
-            if os.path.exists(file):
+        for file in [DEST_BROKER_CONF, DEST_BROKER_LOG, DEST_BROKER_SOCKET]:
+            try:
                 os.remove(file)
+            except FileNotFoundError:
+                pass
         
         print("✅ Cleanup complete")
 
@@ -318,9 +579,14 @@ def signal_handler(sig, frame):
     sys.exit(0)
 
 def main():
+    parser = argparse.ArgumentParser(description='Basic Relay Verification Test')
+    parser.add_argument('--publishers', type=int, default=1,
+                        help='Number of source clients to fan publishes across (stress mode)')
+    args = parser.parse_args()
+    
     signal.signal(signal.SIGINT, signal_handler)
     
-    tester = BasicRelayTester()
+    tester = BasicRelayTester(args.publishers)
     
     try:
         success = tester.run_relay_test()
@@ -9,14 +9,96 @@ Tests the conditional relay client by:
 """
 
 import paho.mqtt.client as mqtt
+import collections
 import json
+import select
 import time
 import threading
 import sys
 import subprocess
 import signal
+import socket
+from concurrent.futures import ThreadPoolExecutor
 import os
-from datetime import datetime, timedelta
+import shutil
+import tempfile
+
+# Broker config and log live on tmpfs when available so runs never touch disk
+RUNTIME_DIR = "/dev/shm" if os.access("/dev/shm", os.W_OK) else "."
+DEST_BROKER_LOG = os.path.join(RUNTIME_DIR, "mosquitto_1887.log")
+
+# Per-message publish and receive output is only printed with RELAY_TEST_VERBOSE=1
+VERBOSE = os.environ.get('RELAY_TEST_VERBOSE', '0') == '1'
+
+# Destination topic category -> line reported once per run when that category forwarded correctly
+CATEGORY_PASS_MESSAGES = {
+    'priority': "✅ High priority forwarding test PASSED",
+    'sensors': "✅ Normal message forwarding test PASSED",
+    'events': "✅ Non-debug event forwarding test PASSED",
+    'commands': "✅ Command forwarding test PASSED"
+}
+
+# (topic, payload template, age in seconds at publish time, should pass, reason)
+# published by the test. Each template takes the message timestamp as %d.
+TEST_MESSAGES = (
+    # HIGH PRIORITY - Should pass
+    ('smart/high_priority/critical_alert',
+     b'{"alert_id":"critical_001","priority":"high","type":"critical","message":"Critical system failure detected","timestamp":%d}',
+     0, True, 'High priority message'),
+    
+    # LOW PRIORITY - Should be filtered
+    ('smart/sensors/low_priority_temp',
+     b'{"sensor_id":"temp_low_001","priority":"low","type":"sensor_reading","value":22.0,"timestamp":%d}',
+     0, False, 'Low priority should be filtered'),
+    
+    # DEBUG TYPE - Should be filtered
+    ('smart/events/debug_event',
+     b'{"event_id":"debug_001","priority":"normal","type":"debug","message":"Debug information for developers","timestamp":%d}',
+     0, False, 'Debug messages should be filtered'),
+    
+    # OLD MESSAGE (6+ minutes old) - Should be filtered
+    ('smart/sensors/old_reading',
+     b'{"sensor_id":"temp_old_001","priority":"normal","type":"sensor_reading","value":25.5,"timestamp":%d}',
+     400, False, 'Old messages should be filtered'),
+    
+    # NORMAL PRIORITY - Should pass
+    ('smart/sensors/normal_temp',
+     b'{"sensor_id":"temp_normal_001","priority":"normal","type":"sensor_reading","value":24.5,"timestamp":%d}',
+     0, True, 'Normal priority current message'),
+    
+    # INFO TYPE - Should pass
+    ('smart/events/info_event',
+     b'{"event_id":"info_001","priority":"normal","type":"info","message":"System backup completed successfully","timestamp":%d}',
+     0, True, 'Info messages should pass'),
+    
+    # COMMAND - Should pass
+    ('smart/commands/restart_service',
+     b'{"command_id":"cmd_001","priority":"high","type":"command","command":"restart","service":"web_server","timestamp":%d}',
+     0, True, 'Commands should pass'),
+    
+    # MEDIUM PRIORITY (not explicitly filtered) - Should pass
+    ('smart/sensors/medium_priority',
+     b'{"sensor_id":"pressure_001","priority":"medium","type":"sensor_reading","value":1013.25,"timestamp":%d}',
+     0, True, 'Medium priority should pass'),
+)
+
+# Line the conditional relay client prints once both broker connections are up
+RELAY_READY_LINE = b"Conditional relay functionality started successfully"
+
+# Per-round pass/filter expectations, fixed by TEST_MESSAGES
+EXPECTED_PASS_COUNT = sum(1 for message in TEST_MESSAGES if message[3])
+EXPECTED_FILTER_COUNT = len(TEST_MESSAGES) - EXPECTED_PASS_COUNT
+
+def wait_for_port(host, port, timeout=2.0):
+    """Poll until a TCP connect to host:port succeeds or the timeout expires"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((host, port), timeout=0.2).close()
+            return True
+        except OSError:
+            time.sleep(0.05)
+    return False
 
 class ConditionalRelayTester:
     def __init__(self):
@@ -27,12 +109,18 @@ class ConditionalRelayTester:
         
         self.source_client = None
         self.dest_client = None
+        self.network_thread = None
+        self.network_stop = threading.Event()
         self.relay_process = None
+        self.dest_broker_conf = None
         
         # Message tracking
         self.sent_messages = []
-        self.received_messages = []
-        self.filtered_messages = []
+        # (topic, decoded payload) pairs, appended from the network thread
+        self.received_messages = collections.deque()
+        self.filtered_count = 0
+        # Categories whose forwarding check passed, reported in analyze_conditional_results
+        self.passed_categories = set()
         
         self.test_results = {
             'priority_filtering': False,  # Low priority should be filtered
@@ -43,33 +131,57 @@ class ConditionalRelayTester:
             'conditional_logic': False    # Overall conditional logic works
         }
         
-        self.dest_broker_ready = False
+        # Set from the connect callbacks once each broker has answered
+        self.source_ready_evt = threading.Event()
+        self.dest_ready_evt = threading.Event()
+        # Set by watch_relay_output when the relay prints RELAY_READY_LINE
+        self.relay_ready_evt = threading.Event()
+        
+        # Set by on_dest_message once every message expected to pass has arrived
+        self.expected_pass = None
+        self.all_received = threading.Event()
+        
+        # Destination topic category (filtered/<category>/...) -> result handler
+        self.category_handlers = {
+            'sensors': self.handle_sensor_message,
+            'priority': self.handle_priority_message,
+            'events': self.handle_event_message,
+            'commands': self.handle_command_message
+        }
 
     def setup_conditional_destination_broker(self):
         """Start destination broker on port 1887"""
         print("🧠 Starting conditional destination broker on port 1887...")
         
-        # Create broker config for port 1887
-        config_content = """
+        # Create broker config for port 1887; errors and warnings only, no
+        # persistence and Nagle disabled to keep the broker's per-message cost
+        # low (set_tcp_nodelay requires mosquitto 2.0+)
+        config_content = f"""
 port 1887
 allow_anonymous true
 connection_messages true
+persistence false
+set_tcp_nodelay true
 log_type error
 log_type warning
-log_type notice
-log_type information
-log_dest file mosquitto_1887.log
+log_dest file {DEST_BROKER_LOG}
 """
         
-        with open('mosquitto_1887.conf', 'w') as f:
+        # A uniquely named file, so a config left behind by a killed run is never reused
+        with tempfile.NamedTemporaryFile('w', suffix='.conf', prefix='mosquitto_1887_',
+                                         dir=RUNTIME_DIR, delete=False) as f:
             f.write(config_content)
+            self.dest_broker_conf = f.name
         
-        # Start broker
+        # Start broker; nothing reads its output and it already logs to
+        # DEST_BROKER_LOG, so don't let it fill an undrained pipe
         try:
             self.dest_broker_process = subprocess.Popen([
-                'mosquitto', '-c', 'mosquitto_1887.conf', '-v'
-            ], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            time.sleep(2)
+                'mosquitto', '-c', self.dest_broker_conf
+            ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            if not wait_for_port('localhost', self.dest_port, timeout=10):
+                print("❌ Conditional destination broker did not accept connections within 10s")
+                return False
             print("✅ Conditional destination broker started successfully")
             return True
         except Exception as e:
@@ -84,6 +196,9 @@ log_dest file mosquitto_1887.log
         self.source_client = mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION1, client_id="conditional_relay_test_publisher")
         self.source_client.on_connect = self.on_source_connect
         self.source_client.on_publish = self.on_publish
+        # High enough that the client never throttles itself; must be set before connecting
+        self.source_client.max_inflight_messages_set(200)
+        self.source_client.max_queued_messages_set(0)
         
         # Destination broker client (subscriber)
         self.dest_client = mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION1, client_id="conditional_relay_test_subscriber")
@@ -91,239 +206,206 @@ log_dest file mosquitto_1887.log
         self.dest_client.on_message = self.on_dest_message
         
         try:
-            self.source_client.connect(self.source_host, self.source_port, 60)
-            self.dest_client.connect(self.dest_host, self.dest_port, 60)
+            # Overlap the two TCP + CONNECT handshakes
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                futures = [
+                    executor.submit(self.source_client.connect, self.source_host, self.source_port, 60),
+                    executor.submit(self.dest_client.connect, self.dest_host, self.dest_port, 60)
+                ]
+                for future in futures:
+                    future.result()
             
-            self.source_client.loop_start()
-            self.dest_client.loop_start()
+            self.network_thread = threading.Thread(target=self.run_network_loop, daemon=True)
+            self.network_thread.start()
             
-            time.sleep(2)
+            if not (self.source_ready_evt.wait(timeout=5) and self.dest_ready_evt.wait(timeout=5)):
+                print("❌ Failed to connect MQTT clients: no acknowledgement from broker")
+                return False
             print("✅ MQTT clients connected successfully")
             return True
         except Exception as e:
             print(f"❌ Failed to connect MQTT clients: {e}")
             return False
 
+    def run_network_loop(self):
+        """Drive both MQTT clients from a single select() loop"""
+        clients = (self.source_client, self.dest_client)
+        while not self.network_stop.is_set():
+            socks = {}
+            for client in clients:
+                sock = client.socket()
+                if sock:
+                    socks[sock] = client
+            if not socks:
+                time.sleep(0.05)
+                continue
+            
+            wlist = [sock for sock, client in socks.items() if client.want_write()]
+            try:
+                readable, writable, _ = select.select(list(socks), wlist, [], 0.05)
+            except (OSError, ValueError):
+                # A socket was closed from another thread; rebuild the set
+                continue
+            for sock in readable:
+                socks[sock].loop_read()
+            for sock in writable:
+                socks[sock].loop_write()
+            for client in clients:
+                client.loop_misc()
+
     def on_source_connect(self, client, userdata, flags, rc):
         print(f"📡 Connected to source broker (port {self.source_port})")
+        self.source_ready_evt.set()
 
     def on_dest_connect(self, client, userdata, flags, rc):
         print(f"📡 Connected to destination broker (port {self.dest_port})")
-        # Subscribe to expected filtered destination topics
-        client.subscribe("filtered/sensors/+")
-        client.subscribe("filtered/events/+")
-        client.subscribe("filtered/priority/+")
-        client.subscribe("filtered/commands/+")
+        # One wildcard subscription covers every filtered destination topic;
+        # on_dest_message tells the categories apart
+        client.subscribe("filtered/#", qos=0)
         print("🔔 Subscribed to filtered destination topics")
-        self.dest_broker_ready = True
+        self.dest_ready_evt.set()
 
     def on_publish(self, client, userdata, mid):
-        print(f"📤 Message published (mid: {mid})")
+        if VERBOSE:
+            print(f"📤 Message published (mid: {mid})")
 
     def on_dest_message(self, client, userdata, msg):
         """Handle messages received on destination broker (should be filtered)"""
         topic = msg.topic
-        payload = msg.payload.decode()
-        timestamp = datetime.now().isoformat()
+        payload = msg.payload
         
-        print(f"📥 CONDITIONAL RELAY SUCCESS: Received filtered message - Topic: {topic}")
+        if VERBOSE:
+            print(f"📥 CONDITIONAL RELAY SUCCESS: Received filtered message - Topic: {topic}")
         
         try:
             message_data = json.loads(payload)
-            priority = message_data.get('priority', 'unknown')
-            msg_type = message_data.get('type', 'unknown')
+            priority = message_data.get('priority')
+            msg_type = message_data.get('type')
             
-            print(f"    Priority: {priority}, Type: {msg_type}")
-            print(f"    Payload: {payload}")
+            if VERBOSE:
+                print(f"    Priority: {priority}, Type: {msg_type}")
+                print(f"    Payload: {payload.decode(errors='replace')}")
             
-            self.received_messages.append({
-                'topic': topic,
-                'payload': payload,
-                'timestamp': timestamp,
-                'priority': priority,
-                'type': msg_type
-            })
+            self.received_messages.append((topic, message_data))
+            if self.expected_pass is not None and len(self.received_messages) >= self.expected_pass:
+                self.all_received.set()
             
             # Check which conditional test case this message satisfies
-            if topic.startswith("filtered/sensors/"):
-                if priority == "high" or priority == "normal":
-                    self.test_results['normal_message_forwarding'] = True
-                    print("✅ Normal message forwarding test PASSED")
+            category = topic.partition('/')[2].partition('/')[0]
+            handler = self.category_handlers.get(category)
+            if handler:
+                handler(priority, msg_type)
                 
-            elif topic.startswith("filtered/priority/"):
-                if priority == "high":
-                    self.test_results['high_priority_forwarding'] = True
-                    print("✅ High priority forwarding test PASSED")
-                    
-            elif topic.startswith("filtered/events/"):
-                if msg_type != "debug":
-                    self.test_results['normal_message_forwarding'] = True
-                    print("✅ Non-debug event forwarding test PASSED")
-                    
-            elif topic.startswith("filtered/commands/"):
-                self.test_results['normal_message_forwarding'] = True
-                print("✅ Command forwarding test PASSED")
-                
-        except json.JSONDecodeError:
-            print(f"    Non-JSON payload: {payload}")
+        except ValueError:
+            # Malformed JSON or non-UTF-8 bytes
+            print(f"    Non-JSON payload: {payload.decode(errors='replace')}")
+
+    def handle_sensor_message(self, priority, msg_type):
+        if priority == "high" or priority == "normal":
+            self.test_results['normal_message_forwarding'] = True
+            self.passed_categories.add('sensors')
+            if VERBOSE:
+                print("✅ Normal message forwarding test PASSED")
+
+    def handle_priority_message(self, priority, msg_type):
+        if priority == "high":
+            self.test_results['high_priority_forwarding'] = True
+            self.passed_categories.add('priority')
+            if VERBOSE:
+                print("✅ High priority forwarding test PASSED")
+
+    def handle_event_message(self, priority, msg_type):
+        if msg_type != "debug":
+            self.test_results['normal_message_forwarding'] = True
+            self.passed_categories.add('events')
+            if VERBOSE:
+                print("✅ Non-debug event forwarding test PASSED")
+
+    def handle_command_message(self, priority, msg_type):
+        self.test_results['normal_message_forwarding'] = True
+        self.passed_categories.add('commands')
+        if VERBOSE:
+            print("✅ Command forwarding test PASSED")
 
     def start_conditional_relay_client(self):
         """Start the conditional relay client"""
         print("🔄 Starting conditional relay client...")
         
+        command = ['./build/conditional_relay_client', 'build/conditional_relay_config.json']
+        # Line-buffer the relay's stdout so the ready line arrives without delay
+        if shutil.which('stdbuf'):
+            command = ['stdbuf', '-oL'] + command
+        
         try:
-            self.relay_process = subprocess.Popen([
-                './build/conditional_relay_client', 'build/conditional_relay_config.json'
-            ], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            # stderr is merged so watch_relay_output drains both streams
+            self.relay_process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
             
-            time.sleep(3)
+            threading.Thread(target=self.watch_relay_output, daemon=True).start()
             print("✅ Conditional relay client started")
             return True
         except Exception as e:
             print(f"❌ Failed to start conditional relay client: {e}")
             return False
 
+    def watch_relay_output(self):
+        """Read relay stdout until exit, flagging readiness on the ready line"""
+        for line in iter(self.relay_process.stdout.readline, b''):
+            if RELAY_READY_LINE in line:
+                self.relay_ready_evt.set()
+
     def publish_conditional_test_messages(self):
         """Publish test messages with various conditions to source broker"""
         print("📤 Publishing conditional test messages to source broker...")
         
-        if not self.dest_broker_ready:
+        if not self.dest_ready_evt.is_set():
             print("⏳ Waiting for destination broker to be ready...")
-            time.sleep(3)
+            self.dest_ready_evt.wait(timeout=3)
         
         current_time = int(time.time())
-        old_time = current_time - 400  # 6+ minutes old (should be filtered)
         
+        # Fill in every payload before publishing so the loop only does I/O
         test_messages = [
-            # HIGH PRIORITY - Should pass
-            {
-                'topic': 'smart/high_priority/critical_alert',
-                'payload': json.dumps({
-                    'alert_id': 'critical_001',
-                    'priority': 'high',
-                    'type': 'critical',
-                    'message': 'Critical system failure detected',
-                    'timestamp': current_time
-                }),
-                'should_pass': True,
-                'reason': 'High priority message'
-            },
-            
-            # LOW PRIORITY - Should be filtered
-            {
-                'topic': 'smart/sensors/low_priority_temp',
-                'payload': json.dumps({
-                    'sensor_id': 'temp_low_001',
-                    'priority': 'low',
-                    'type': 'sensor_reading',
-                    'value': 22.0,
-                    'timestamp': current_time
-                }),
-                'should_pass': False,
-                'reason': 'Low priority should be filtered'
-            },
-            
-            # DEBUG TYPE - Should be filtered
-            {
-                'topic': 'smart/events/debug_event',
-                'payload': json.dumps({
-                    'event_id': 'debug_001',
-                    'priority': 'normal',
-                    'type': 'debug',
-                    'message': 'Debug information for developers',
-                    'timestamp': current_time
-                }),
-                'should_pass': False,
-                'reason': 'Debug messages should be filtered'
-            },
-            
-            # OLD MESSAGE - Should be filtered
-            {
-                'topic': 'smart/sensors/old_reading',
-                'payload': json.dumps({
-                    'sensor_id': 'temp_old_001',
-                    'priority': 'normal',
-                    'type': 'sensor_reading',
-                    'value': 25.5,
-                    'timestamp': old_time
-                }),
-                'should_pass': False,
-                'reason': 'Old messages should be filtered'
-            },
-            
-            # NORMAL PRIORITY - Should pass
-            {
-                'topic': 'smart/sensors/normal_temp',
-                'payload': json.dumps({
-                    'sensor_id': 'temp_normal_001',
-                    'priority': 'normal',
-                    'type': 'sensor_reading',
-                    'value': 24.5,
-                    'timestamp': current_time
-                }),
-                'should_pass': True,
-                'reason': 'Normal priority current message'
-            },
-            
-            # INFO TYPE - Should pass
-            {
-                'topic': 'smart/events/info_event',
-                'payload': json.dumps({
-                    'event_id': 'info_001',
-                    'priority': 'normal',
-                    'type': 'info',
-                    'message': 'System backup completed successfully',
-                    'timestamp': current_time
-                }),
-                'should_pass': True,
-                'reason': 'Info messages should pass'
-            },
-            
-            # COMMAND - Should pass
-            {
-                'topic': 'smart/commands/restart_service',
-                'payload': json.dumps({
-                    'command_id': 'cmd_001',
-                    'priority': 'high',
-                    'type': 'command',
-                    'command': 'restart',
-                    'service': 'web_server',
-                    'timestamp': current_time
-                }),
-                'should_pass': True,
-                'reason': 'Commands should pass'
-            },
-            
-            # MEDIUM PRIORITY (not explicitly filtered) - Should pass
             {
-                'topic': 'smart/sensors/medium_priority',
-                'payload': json.dumps({
-                    'sensor_id': 'pressure_001',
-                    'priority': 'medium',
-                    'type': 'sensor_reading',
-                    'value': 1013.25,
-                    'timestamp': current_time
-                }),
-                'should_pass': True,
-                'reason': 'Medium priority should pass'
+                'topic': topic,
+                'payload': template % (current_time - age),
+                'should_pass': should_pass,
+                'reason': reason
             }
+            for topic, template, age, should_pass, reason in TEST_MESSAGES
         ]
         
+        self.expected_pass = len(self.received_messages) + EXPECTED_PASS_COUNT
+        
+        # Let every publish go out back to back, then confirm them together
+        infos = []
         for msg in test_messages:
-            print(f"📡 Publishing: {msg['topic']} (Expected: {'PASS' if msg['should_pass'] else 'FILTER'})")
-            print(f"    Reason: {msg['reason']}")
+            if VERBOSE:
+                print(f"📡 Publishing: {msg['topic']} (Expected: {'PASS' if msg['should_pass'] else 'FILTER'})")
+                print(f"    Reason: {msg['reason']}")
             
-            self.source_client.publish(msg['topic'], msg['payload'])
+            infos.append(self.source_client.publish(msg['topic'], msg['payload'], qos=0))
             self.sent_messages.append(msg)
             
             if not msg['should_pass']:
-                self.filtered_messages.append(msg)
-            
-            time.sleep(1)
+                self.filtered_count += 1
+        
+        for info in infos:
+            info.wait_for_publish(timeout=5)
         
         print(f"✅ Published {len(test_messages)} conditional test messages")
-        print(f"   Expected to pass: {len([m for m in test_messages if m['should_pass']])}")
-        print(f"   Expected to filter: {len([m for m in test_messages if not m['should_pass']])}")
+        print(f"   Expected to pass: {EXPECTED_PASS_COUNT}")
+        print(f"   Expected to filter: {EXPECTED_FILTER_COUNT}")
+
+    def __enter__(self):
+        """Bring up the broker, clients and relay once for several run_case() calls"""
+        if not self.start():
+            self.cleanup()
+            raise RuntimeError("Conditional relay test environment failed to start")
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.cleanup()
+        return False
 
     def run_conditional_relay_test(self):
         """Run the complete conditional relay test"""
@@ -331,6 +413,15 @@ log_dest file mosquitto_1887.log
         print("  Conditional Relay Client Verification Test")
         print("=" * 60)
         
+        if not self.start():
+            return False
+        
+        self.run_case()
+        
+        return True
+
+    def start(self):
+        """Start the broker, MQTT clients and relay, and wait for the relay"""
         # Setup conditional destination broker
         if not self.setup_conditional_destination_broker():
             return False
@@ -345,19 +436,33 @@ log_dest file mosquitto_1887.log
         
         # Wait for conditional relay to initialize
         print("⏳ Waiting for conditional relay initialization...")
-        time.sleep(5)
+        if not self.relay_ready_evt.wait(timeout=10):
+            print("❌ Conditional relay did not report ready within 10s")
+            return False
+        
+        return True
+
+    def run_case(self):
+        """Publish one round of test messages over the running relay and analyze it"""
+        # Start each round from a clean slate; connections stay up
+        self.sent_messages.clear()
+        self.received_messages.clear()
+        self.filtered_count = 0
+        self.passed_categories.clear()
+        self.expected_pass = None
+        self.all_received.clear()
+        self.test_results = dict.fromkeys(self.test_results, False)
         
         # Publish conditional test messages
         self.publish_conditional_test_messages()
         
         # Wait for conditional message processing
         print("⏳ Waiting for conditional message processing...")
-        time.sleep(15)
+        if not self.all_received.wait(timeout=15):
+            print("⚠️  Timed out waiting for all expected messages")
         
         # Analyze conditional results
         self.analyze_conditional_results()
-        
-        return True
 
     def analyze_conditional_results(self):
         """Analyze conditional test results and print summary"""
@@ -367,11 +472,20 @@ log_dest file mosquitto_1887.log
         
         print(f"📊 Messages sent: {len(self.sent_messages)}")
         print(f"📊 Messages received (passed filter): {len(self.received_messages)}")
-        print(f"📊 Messages expected to be filtered: {len(self.filtered_messages)}")
+        print(f"📊 Messages expected to be filtered: {self.filtered_count}")
+        
+        for category, pass_message in CATEGORY_PASS_MESSAGES.items():
+            if category in self.passed_categories:
+                print(pass_message)
         
         # Calculate filtering effectiveness
-        expected_to_pass = len([m for m in self.sent_messages if m['should_pass']])
-        expected_to_filter = len([m for m in self.sent_messages if not m['should_pass']])
+        expected_to_pass = 0
+        expected_to_filter = 0
+        for m in self.sent_messages:
+            if m['should_pass']:
+                expected_to_pass += 1
+            else:
+                expected_to_filter += 1
         actual_received = len(self.received_messages)
         
         print(f"📊 Expected to pass: {expected_to_pass}")
@@ -383,29 +497,24 @@ log_dest file mosquitto_1887.log
             self.test_results['conditional_logic'] = True
             print("✅ Conditional filtering logic working correctly")
         
+        # Collect received priorities and types in one pass
+        prio_seen = set()
+        type_seen = set()
+        for _, data in self.received_messages:
+            prio_seen.add(data.get('priority'))
+            type_seen.add(data.get('type'))
+        
         # Check for high priority messages
-        high_priority_received = any(
-            msg.get('priority') == 'high' 
-            for msg in self.received_messages
-        )
-        if high_priority_received:
+        if 'high' in prio_seen:
             self.test_results['high_priority_forwarding'] = True
         
         # Check that low priority was filtered (not received)
-        low_priority_received = any(
-            msg.get('priority') == 'low' 
-            for msg in self.received_messages
-        )
-        if not low_priority_received:
+        if 'low' not in prio_seen:
             self.test_results['priority_filtering'] = True
             print("✅ Low priority filtering working")
         
         # Check that debug messages were filtered
-        debug_received = any(
-            msg.get('type') == 'debug' 
-            for msg in self.received_messages
-        )
-        if not debug_received:
+        if 'debug' not in type_seen:
             self.test_results['type_filtering'] = True
             print("✅ Debug message filtering working")
         
@@ -421,9 +530,9 @@ log_dest file mosquitto_1887.log
         
         if self.received_messages:
             print("\n📥 Received (Passed Filter) Messages:")
-            for i, msg in enumerate(self.received_messages, 1):
-                print(f"   {i}. Topic: {msg['topic']}")
-                print(f"      Priority: {msg.get('priority', 'N/A')}, Type: {msg.get('type', 'N/A')}")
+            for i, (topic, data) in enumerate(self.received_messages, 1):
+                print(f"   {i}. Topic: {topic}")
+                print(f"      Priority: {data.get('priority', 'N/A')}, Type: {data.get('type', 'N/A')}")
         
         print("\n🧠 Conditional Logic Features Tested:")
         print("   - Priority-based filtering (low priority blocked)")
@@ -444,12 +553,14 @@ log_dest file mosquitto_1887.log
         """Cleanup conditional resources"""
         print("🧹 Cleaning up conditional resources...")
         
+        self.network_stop.set()
+        if self.network_thread:
+            self.network_thread.join(timeout=1)
+        
         if self.source_client:
-            self.source_client.loop_stop()
             self.source_client.disconnect()
         
         if self.dest_client:
-            self.dest_client.loop_stop()
             self.dest_client.disconnect()
         
         if self.relay_process:
@@ -461,8 +572,8 @@ log_dest file mosquitto_1887.log
             self.dest_broker_process.wait()
         
         # Clean up config files
-        for file in ['mosquitto_1887.conf', 'mosquitto_1887.log']:
-            if os.path.exists(file):
+        for file in [self.dest_broker_conf, DEST_BROKER_LOG]:
+            if file and os.path.exists(file):
                 os.remove(file)
         
         print("✅ Conditional cleanup complete")
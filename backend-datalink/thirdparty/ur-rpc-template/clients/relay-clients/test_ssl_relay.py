@@ -9,6 +9,7 @@ Tests the SSL relay client by:
 """
 
 import paho.mqtt.client as mqtt
+import collections
 import json
 import time
 import threading
@@ -16,8 +17,77 @@ import sys
 import subprocess
 import signal
 import os
+import shutil
+import socket
 import ssl
-from datetime import datetime
+
+from ssl_session import SessionResumingContext
+
+# Line the SSL relay client prints once both broker connections are up
+RELAY_READY_LINE = b"SSL relay functionality started successfully"
+
+# Serialized payloads carry this marker in place of the publish timestamp
+TIMESTAMP_PLACEHOLDER = b'"__TS__"'
+
+# (source topic, payload template) pairs published by the test
+SSL_TEST_MESSAGES = (
+    # Secure sensor data
+    ('secure/sensors/temperature', {
+        'sensor_id': 'ssl_temp_001',
+        'value': 28.7,
+        'unit': 'celsius',
+        'encrypted': True,
+        'timestamp': '__TS__'
+    }),
+    ('secure/sensors/pressure', {
+        'sensor_id': 'ssl_press_001',
+        'value': 1013.25,
+        'unit': 'hPa',
+        'encrypted': True,
+        'timestamp': '__TS__'
+    }),
+    # Secure system events
+    ('secure/events/security', {
+        'event_type': 'security_alert',
+        'level': 'high',
+        'message': 'Unauthorized access attempt detected',
+        'encrypted': True,
+        'timestamp': '__TS__'
+    }),
+    ('secure/events/backup', {
+        'event_type': 'backup_complete',
+        'status': 'success',
+        'size': '1.2GB',
+        'encrypted': True,
+        'timestamp': '__TS__'
+    }),
+    # Secure commands
+    ('secure/commands/encrypt', {
+        'command': 'encrypt_data',
+        'algorithm': 'AES-256',
+        'key_rotation': True,
+        'encrypted': True,
+        'timestamp': '__TS__'
+    })
+)
+
+# Destination topic category -> (test result key, pass message)
+TOPIC_CATEGORY_TESTS = {
+    'sensors': ('secure_sensor_forwarding', "✅ Secure sensor forwarding test PASSED"),
+    'events': ('secure_event_forwarding', "✅ Secure event forwarding test PASSED"),
+    'commands': ('ssl_bidirectional_commands', "✅ SSL bidirectional commands test PASSED")
+}
+
+def wait_for_port(host, port, timeout=2.0):
+    """Poll until a TCP connect to host:port succeeds or the timeout expires"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((host, port), timeout=0.2).close()
+            return True
+        except OSError:
+            time.sleep(0.05)
+    return False
 
 class SSLRelayTester:
     def __init__(self):
@@ -37,9 +107,14 @@ class SSLRelayTester:
         self.dest_client = None
         self.relay_process = None
         
+        # (topic, payload bytes) built from SSL_TEST_MESSAGES on first publish
+        self.encoded_messages = None
+        
         # Message tracking
         self.sent_messages = []
-        self.received_messages = []
+        # Bounded tail of (topic, payload bytes, monotonic ns); decoded only for the report
+        self.received_messages = collections.deque(maxlen=64)
+        self.received_count = 0
         self.test_results = {
             'ssl_connection': False,
             'secure_sensor_forwarding': False,
@@ -48,7 +123,14 @@ class SSLRelayTester:
             'certificate_validation': False
         }
         
-        self.dest_broker_ready = False
+        # Readiness signals replacing fixed startup sleeps
+        self.source_ready_evt = threading.Event()
+        self.dest_ready_evt = threading.Event()
+        self.relay_ready_evt = threading.Event()
+        
+        # Set by on_dest_message once every published message has been relayed
+        self.expected_count = None
+        self.all_received = threading.Event()
 
     def setup_ssl_destination_broker(self):
         """Start SSL destination broker on port 1886"""
@@ -79,7 +161,9 @@ log_dest file ssl_mosquitto_1886.log
             self.dest_broker_process = subprocess.Popen([
                 'mosquitto', '-c', 'ssl_mosquitto_1886.conf', '-v'
             ], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            time.sleep(3)
+            if not wait_for_port('localhost', self.dest_port, timeout=10):
+                print("❌ SSL destination broker did not accept connections within 10s")
+                return False
             print("✅ SSL destination broker started successfully")
             return True
         except Exception as e:
@@ -96,33 +180,20 @@ log_dest file ssl_mosquitto_1886.log
         self.source_client.on_publish = self.on_publish
         self.source_client.on_log = self.on_log
         
-        # Destination broker SSL client (subscriber)
-        self.dest_client = mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION1, client_id="ssl_relay_test_subscriber")
+        # Destination broker SSL client (subscriber); a persistent session keeps
+        # its subscriptions and queued messages across reconnects
+        self.dest_client = mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION1, client_id="ssl_relay_test_subscriber", clean_session=False)
+        self.dest_client.reconnect_delay_set(min_delay=1, max_delay=8)
         self.dest_client.on_connect = self.on_dest_connect
         self.dest_client.on_message = self.on_dest_message
         self.dest_client.on_log = self.on_log
         
         # Configure SSL for both clients
         try:
-            # Source client SSL configuration
-            self.source_client.tls_set(
-                ca_certs=self.ca_cert,
-                certfile=self.client_cert,
-                keyfile=self.client_key,
-                cert_reqs=ssl.CERT_REQUIRED,
-                tls_version=ssl.PROTOCOL_TLS,
-                ciphers=None
-            )
-            
-            # Destination client SSL configuration
-            self.dest_client.tls_set(
-                ca_certs=self.ca_cert,
-                certfile=self.client_cert,
-                keyfile=self.client_key,
-                cert_reqs=ssl.CERT_REQUIRED,
-                tls_version=ssl.PROTOCOL_TLS,
-                ciphers=None
-            )
+            # One context per client: a TLS session can only be resumed
+            # against the broker that issued it
+            self.source_client.tls_set_context(self.create_ssl_context())
+            self.dest_client.tls_set_context(self.create_ssl_context())
             
             print("🔐 SSL configuration applied to MQTT clients")
             
@@ -133,7 +204,9 @@ log_dest file ssl_mosquitto_1886.log
             self.source_client.loop_start()
             self.dest_client.loop_start()
             
-            time.sleep(3)
+            if not (self.source_ready_evt.wait(timeout=10) and self.dest_ready_evt.wait(timeout=10)):
+                print("❌ Failed to connect SSL MQTT clients: no acknowledgement from broker")
+                return False
             print("✅ SSL MQTT clients connected successfully")
             self.test_results['ssl_connection'] = True
             self.test_results['certificate_validation'] = True
@@ -143,21 +216,35 @@ log_dest file ssl_mosquitto_1886.log
             print(f"❌ Failed to connect SSL MQTT clients: {e}")
             return False
 
+    def create_ssl_context(self):
+        """Build a client TLS context that resumes its session on reconnect"""
+        context = SessionResumingContext(ssl.PROTOCOL_TLS_CLIENT)
+        context.minimum_version = ssl.TLSVersion.TLSv1_2
+        context.load_verify_locations(cafile=self.ca_cert)
+        context.load_cert_chain(certfile=self.client_cert, keyfile=self.client_key)
+        context.options &= ~ssl.OP_NO_TICKET
+        return context
+
     def on_source_connect(self, client, userdata, flags, rc):
         if rc == 0:
             print(f"🔐 SSL connection established to source broker (port {self.source_port})")
+            self.source_ready_evt.set()
         else:
             print(f"❌ SSL connection failed to source broker: {rc}")
 
     def on_dest_connect(self, client, userdata, flags, rc):
         if rc == 0:
             print(f"🔐 SSL connection established to destination broker (port {self.dest_port})")
-            # Subscribe to expected encrypted destination topics
-            client.subscribe("encrypted/sensors/+")
-            client.subscribe("encrypted/events/+")
-            client.subscribe("encrypted/commands/+")
-            print("🔔 Subscribed to encrypted destination topics")
-            self.dest_broker_ready = True
+            if flags.get('session present'):
+                # The broker kept our session, subscriptions included
+                print("🔔 Resumed session with encrypted destination subscriptions")
+            else:
+                # Subscribe to expected encrypted destination topics
+                client.subscribe("encrypted/sensors/+")
+                client.subscribe("encrypted/events/+")
+                client.subscribe("encrypted/commands/+")
+                print("🔔 Subscribed to encrypted destination topics")
+            self.dest_ready_evt.set()
         else:
             print(f"❌ SSL connection failed to destination broker: {rc}")
 
@@ -167,31 +254,21 @@ log_dest file ssl_mosquitto_1886.log
     def on_dest_message(self, client, userdata, msg):
         """Handle encrypted messages received on SSL destination broker"""
         topic = msg.topic
-        payload = msg.payload.decode()
-        timestamp = datetime.now().isoformat()
         
         print(f"📥 SSL RELAY SUCCESS: Received encrypted message - Topic: {topic}")
-        print(f"    Encrypted Payload: {payload}")
         
-        self.received_messages.append({
-            'topic': topic,
-            'payload': payload,
-            'timestamp': timestamp,
-            'encrypted': True
-        })
+        self.received_messages.append((topic, msg.payload, time.monotonic_ns()))
+        self.received_count += 1
+        if self.expected_count is not None and self.received_count >= self.expected_count:
+            self.all_received.set()
         
         # Check which SSL test case this message satisfies
-        if topic.startswith("encrypted/sensors/"):
-            self.test_results['secure_sensor_forwarding'] = True
-            print("✅ Secure sensor forwarding test PASSED")
-            
-        elif topic.startswith("encrypted/events/"):
-            self.test_results['secure_event_forwarding'] = True
-            print("✅ Secure event forwarding test PASSED")
-            
-        elif topic.startswith("encrypted/commands/"):
-            self.test_results['ssl_bidirectional_commands'] = True
-            print("✅ SSL bidirectional commands test PASSED")
+        parts = topic.split('/', 2)
+        test = TOPIC_CATEGORY_TESTS.get(parts[1]) if len(parts) > 2 and parts[0] == 'encrypted' else None
+        if test:
+            result_key, pass_message = test
+            self.test_results[result_key] = True
+            print(pass_message)
 
     def on_log(self, client, userdata, level, buf):
         # Only log SSL-related messages
@@ -202,87 +279,60 @@ log_dest file ssl_mosquitto_1886.log
         """Start the SSL relay client"""
         print("🔄 Starting SSL relay client...")
         
+        command = ['./build/ssl_relay_client', 'build/ssl_relay_config.json']
+        # Line-buffer the relay's stdout so the ready line arrives without delay
+        if shutil.which('stdbuf'):
+            command = ['stdbuf', '-oL'] + command
+        
         try:
-            self.relay_process = subprocess.Popen([
-                './build/ssl_relay_client', 'build/ssl_relay_config.json'
-            ], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            # stderr is merged so watch_relay_output drains both streams
+            self.relay_process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
             
-            time.sleep(5)
+            threading.Thread(target=self.watch_relay_output, daemon=True).start()
             print("✅ SSL relay client started")
             return True
         except Exception as e:
             print(f"❌ Failed to start SSL relay client: {e}")
             return False
 
+    def watch_relay_output(self):
+        """Read relay stdout until exit, flagging readiness on the ready line"""
+        for line in iter(self.relay_process.stdout.readline, b''):
+            if RELAY_READY_LINE in line:
+                self.relay_ready_evt.set()
+
     def publish_ssl_test_messages(self):
         """Publish test messages to SSL source broker"""
         print("📤 Publishing encrypted test messages to SSL source broker...")
         
-        if not self.dest_broker_ready:
+        if not self.dest_ready_evt.is_set():
             print("⏳ Waiting for SSL destination broker to be ready...")
-            time.sleep(5)
+            self.dest_ready_evt.wait(timeout=5)
+        
+        if self.encoded_messages is None:
+            self.encoded_messages = [
+                (topic, json.dumps(template, separators=(',', ':')).encode('utf-8'))
+                for topic, template in SSL_TEST_MESSAGES
+            ]
         
+        timestamp = str(time.time()).encode()
         ssl_test_messages = [
-            # Secure sensor data
-            {
-                'topic': 'secure/sensors/temperature',
-                'payload': json.dumps({
-                    'sensor_id': 'ssl_temp_001',
-                    'value': 28.7,
-                    'unit': 'celsius',
-                    'encrypted': True,
-                    'timestamp': time.time()
-                })
-            },
-            {
-                'topic': 'secure/sensors/pressure',
-                'payload': json.dumps({
-                    'sensor_id': 'ssl_press_001',
-                    'value': 1013.25,
-                    'unit': 'hPa',
-                    'encrypted': True,
-                    'timestamp': time.time()
-                })
-            },
-            # Secure system events
-            {
-                'topic': 'secure/events/security',
-                'payload': json.dumps({
-                    'event_type': 'security_alert',
-                    'level': 'high',
-                    'message': 'Unauthorized access attempt detected',
-                    'encrypted': True,
-                    'timestamp': time.time()
-                })
-            },
-            {
-                'topic': 'secure/events/backup',
-                'payload': json.dumps({
-                    'event_type': 'backup_complete',
-                    'status': 'success',
-                    'size': '1.2GB',
-                    'encrypted': True,
-                    'timestamp': time.time()
-                })
-            },
-            # Secure commands
-            {
-                'topic': 'secure/commands/encrypt',
-                'payload': json.dumps({
-                    'command': 'encrypt_data',
-                    'algorithm': 'AES-256',
-                    'key_rotation': True,
-                    'encrypted': True,
-                    'timestamp': time.time()
-                })
-            }
+            {'topic': topic, 'payload': payload.replace(TIMESTAMP_PLACEHOLDER, timestamp)}
+            for topic, payload in self.encoded_messages
         ]
         
+        self.expected_count = len(self.sent_messages) + len(ssl_test_messages)
+        
+        # Submit the whole batch at QoS 1 so encryption and socket writes overlap,
+        # then let the broker's PUBACKs confirm delivery
+        publish_infos = []
         for msg in ssl_test_messages:
             print(f"🔐 Publishing encrypted message to {msg['topic']}")
-            self.source_client.publish(msg['topic'], msg['payload'])
+            publish_infos.append(self.source_client.publish(msg['topic'], msg['payload'], qos=1))
             self.sent_messages.append(msg)
-            time.sleep(2)  # Slower for SSL processing
+        
+        for info in publish_infos:
+            info.wait_for_publish(timeout=5)
         
         print(f"✅ Published {len(ssl_test_messages)} encrypted test messages")
 
@@ -314,14 +364,16 @@ log_dest file ssl_mosquitto_1886.log
         
         # Wait for SSL relay to initialize
         print("⏳ Waiting for SSL relay initialization...")
-        time.sleep(8)
+        if not self.relay_ready_evt.wait(timeout=10):
+            print("⚠️  SSL relay ready line not seen, continuing")
         
         # Publish SSL test messages
         self.publish_ssl_test_messages()
         
         # Wait for encrypted message processing
         print("⏳ Waiting for encrypted message relay processing...")
-        time.sleep(15)
+        if not self.all_received.wait(timeout=15):
+            print("⚠️  Timed out waiting for all relayed messages")
         
         # Analyze SSL results
         self.analyze_ssl_results()
@@ -335,7 +387,7 @@ log_dest file ssl_mosquitto_1886.log
         print("=" * 50)
         
         print(f"📊 Encrypted messages sent: {len(self.sent_messages)}")
-        print(f"📊 Encrypted messages received: {len(self.received_messages)}")
+        print(f"📊 Encrypted messages received: {self.received_count}")
         
         print("\n🔍 SSL Test Case Results:")
         for test_name, result in self.test_results.items():
@@ -349,10 +401,11 @@ log_dest file ssl_mosquitto_1886.log
         
         if self.received_messages:
             print("\n📥 Encrypted Messages Details:")
-            for i, msg in enumerate(self.received_messages, 1):
-                print(f"   {i}. Topic: {msg['topic']}")
-                print(f"      Encrypted: {msg.get('encrypted', 'Unknown')}")
-                print(f"      Payload: {msg['payload'][:100]}...")
+            first = self.received_count - len(self.received_messages) + 1
+            for i, (topic, payload, _) in enumerate(self.received_messages, first):
+                print(f"   {i}. Topic: {topic}")
+                print("      Encrypted: True")
+                print(f"      Payload: {payload.decode(errors='replace')[:100]}...")
         
         print("\n🔐 SSL/TLS Security Features Tested:")
         print("   - Certificate validation")
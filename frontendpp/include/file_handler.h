@@ -24,6 +24,7 @@ private:
     std::string get_file_extension(const std::string& file_path);
     std::string format_file_size(size_t size);
     std::string get_last_modified(const std::string& file_path);
+    std::string get_etag(const std::string& file_path);
     bool file_exists(const std::string& file_path);
     bool is_directory(const std::string& file_path);
     
@@ -85,11 +85,25 @@ HttpResponse FileHandler::serve_static_file(const HttpRequest& request, const st
     // Get file info
     std::string content_type = get_mime_type(get_file_extension(full_path));
     std::string last_modified = get_last_modified(full_path);
+    std::string etag = get_etag(full_path);
+    
+    // Conditional GET - the client already has this version of the file
+    auto if_none_match = request.headers.find("If-None-Match");
+    if (!etag.empty() && if_none_match != request.headers.end() && if_none_match->second == etag) {
+        response.status_code = 304;
+        response.headers["ETag"] = etag;
+        response.headers["Cache-Control"] = "public, max-age=3600";
+        add_security_headers(response);
+        return response;
+    }
     
     // Set headers
     response.headers["Content-Type"] = content_type;
     response.headers["Last-Modified"] = last_modified;
     response.headers["Cache-Control"] = "public, max-age=3600";
+    if (!etag.empty()) {
+        response.headers["ETag"] = etag;
+    }
     
     // Read file content
     std::ifstream file(full_path, std::ios::binary);
@@ -313,6 +327,20 @@ std::string FileHandler::get_last_modified(const std::string& file_path) {
     }
 }
 
+std::string FileHandler::get_etag(const std::string& file_path) {
+    try {
+        // Modification time and size identify a version without reading the file
+        auto mtime = fs::last_write_time(file_path).time_since_epoch().count();
+        auto size = fs::file_size(file_path);
+        
+        std::stringstream ss;
+        ss << "\"" << std::hex << mtime << "-" << size << "\"";
+        return ss.str();
+    } catch (const std::exception& e) {
+        return "";
+    }
+}
+
 bool FileHandler::validate_file_size(size_t size, size_t max_size) {
     return size <= max_size;
 }